@@ -34,6 +34,8 @@ DEFAULT_OUTPUT_RESULT = {
 
 def deep_getitem(obj, path: str):
     try:
+        if ">" not in path:
+            return obj[path]
         return reduce(getitem, path.split(">"), obj)
     except (KeyError, TypeError):
         return None
@@ -178,11 +180,18 @@ def analyze_json(data):
 
         days.append(d_info.to_json())
 
-    result = DEFAULT_OUTPUT_RESULT
+    result = dict(DEFAULT_OUTPUT_RESULT)
     result[OUTPUT_DAYS_KEY] = days
     return result
 
 
+def analyze(input_path: str = PATH_FROM_INPUT, output_path: str = PATH_TO_OUTPUT):
+    data = load_data(input_path)
+    data = analyze_json(data)
+
+    dump_data(data, output_path)
+
+
 if __name__ == "__main__":
     args = parse_args()
     input_path = args.input
@@ -192,7 +201,4 @@ if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG if verbose_mode else logging.WARNING)
     logging.info(args)
 
-    data = load_data(input_path)
-    data = analyze_json(data)
-
-    dump_data(data, output_path)
+    analyze(input_path, output_path)
@@ -1,10 +1,21 @@
 import json
 import logging
 from http import HTTPStatus
-from urllib.request import urlopen
+
+import requests
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger()
 
+POOL_SIZE = 16
+CONNECT_TIMEOUT = 1
+READ_TIMEOUT = 2
+REQUEST_TIMEOUT = CONNECT_TIMEOUT + READ_TIMEOUT
+
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
+_SESSION.mount("http://", HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
+
 
 class YandexWeatherAPIError(Exception):
     def __init__(self, message):
@@ -19,13 +30,10 @@ class YandexWeatherAPI:
     def __do_req(url: str) -> str:
         """Base request method"""
         try:
-            with urlopen(url) as response:
-                resp_body = response.read().decode("utf-8")
-                data = json.loads(resp_body)
-
-            if response.status != HTTPStatus.OK:
-                raise YandexWeatherAPIError(f"Error during execute request. {response.status}: {response.reason}")
-            return data
+            response = _SESSION.get(url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            if response.status_code != HTTPStatus.OK:
+                raise YandexWeatherAPIError(f"HTTP Error {response.status_code}: {response.reason}")
+            return json.loads(response.content)
 
         except Exception as ex:
             logger.error(ex)
@@ -1,77 +1,254 @@
 import os
-import json
+import math
+import atexit
+import queue
 import logging
-import subprocess
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from multiprocessing import Pool
-from queue import Queue
-
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from logging.handlers import QueueHandler
+from typing import Callable, Optional
+
+import orjson
 import xlsxwriter
 
-from external.client import YandexWeatherAPI, YandexWeatherAPIError
+from external import analyzer
+from external.client import POOL_SIZE, REQUEST_TIMEOUT, YandexWeatherAPI, YandexWeatherAPIError
 from utils import get_url_by_city_name, CITIES, CITIES_TRANSLATION
 
 logger = logging.getLogger(__name__)
 
+_PROCESS_POOL: Optional[ProcessPoolExecutor] = None
+_THREAD_POOL: Optional[ThreadPoolExecutor] = None
+THREAD_POOL_MAX_WORKERS = 32
+_WORKER_LOG_QUEUE: Optional[queue.SimpleQueue] = None
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    """
+    Process pool for CPU-bound tasks, shared between task runs
+    """
+    global _PROCESS_POOL
+    if _PROCESS_POOL is None:
+        # spawn instead of fork: threads of the shared thread pool may be alive and hold locks
+        _PROCESS_POOL = ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                            mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker_logging)
+    return _PROCESS_POOL
+
+
+def _init_worker_logging() -> None:
+    """
+    Collect log records of a spawned worker, it does not inherit the parent logging configuration
+    """
+    global _WORKER_LOG_QUEUE
+    _WORKER_LOG_QUEUE = queue.SimpleQueue()
+    root_logger = logging.getLogger()
+    root_logger.handlers = [QueueHandler(_WORKER_LOG_QUEUE)]
+    root_logger.setLevel(logging.DEBUG)
+
+
+def _call_with_logs(func: Callable, *args) -> tuple:
+    """
+    Run func in a process pool worker and return its result with the collected log records
+    """
+    result = func(*args)
+    records = []
+    while not _WORKER_LOG_QUEUE.empty():
+        records.append(_WORKER_LOG_QUEUE.get())
+    return result, records
+
+
+def _handle_worker_records(records: list) -> None:
+    """
+    Pass log records of a process pool worker to the loggers configured in this process
+    """
+    for record in records:
+        worker_logger = logging.getLogger(record.name) if record.name != 'root' else logging.getLogger()
+        if worker_logger.isEnabledFor(record.levelno):
+            worker_logger.handle(record)
+
+
+def _reset_process_pool() -> None:
+    global _PROCESS_POOL
+    if _PROCESS_POOL is not None:
+        _PROCESS_POOL.shutdown(wait=False)
+        _PROCESS_POOL = None
+
+
+def _get_chunksize(tasks_count: int) -> int:
+    """
+    Chunk size to keep every process pool worker loaded with several chunks
+    """
+    return max(1, tasks_count // ((os.cpu_count() or 1) * 4))
+
+
+def _get_fetch_workers(cities_count: int) -> int:
+    """
+    Fetching threads count, every thread needs its own keep-alive connection of the client session
+    """
+    return max(1, min(POOL_SIZE, cities_count))
+
+
+def _get_thread_pool() -> ThreadPoolExecutor:
+    """
+    Thread pool for IO-bound tasks, shared between task runs
+    """
+    global _THREAD_POOL
+    if _THREAD_POOL is None:
+        _THREAD_POOL = ThreadPoolExecutor(max_workers=THREAD_POOL_MAX_WORKERS)
+    return _THREAD_POOL
+
+
+def _shutdown_pools() -> None:
+    for pool in (_PROCESS_POOL, _THREAD_POOL):
+        if pool is not None:
+            pool.shutdown()
+
+
+atexit.register(_shutdown_pools)
+
+
+def create_data_dir(data_dir: str) -> None:
+    """
+    param data_dir: path with data files
+    """
+    try:
+        if not os.path.exists(data_dir):
+            logging.info(f'Cant find directory {data_dir}')
+            os.makedirs(data_dir)
+            logging.info(f'Created directory {data_dir}')
+    except OSError as err:
+        logging.error(f'Cant create directory {data_dir}: \n{err}')
+
+
+def save_json(file_path: str, data: dict) -> None:
+    """
+    param file_path: path to json file
+    param data: data to save
+    """
+    serialized_data = orjson.dumps(data)
+    with open(file_path, 'wb') as json_file:
+        json_file.write(serialized_data)
+
+
+def load_json(file_path: str) -> dict:
+    """
+    param file_path: path to json file
+    """
+    with open(file_path, 'rb') as json_file:
+        return orjson.loads(json_file.read())
+
+
+def fetch_city_data(city_name: str) -> dict:
+    """
+    param city_name: name of city to get data
+    """
+    response = {}
+    try:
+        url_with_data = get_url_by_city_name(city_name)
+        response = YandexWeatherAPI.get_forecasting(url_with_data)
+        response['city_name'] = city_name
+        if 'info' in response:
+            response['status'] = 'OK'
+        else:
+            response['status'] = 'No info'
+            logger.error(f'Failed {city_name}: \n{response["status"]}')
+
+    except YandexWeatherAPIError as err:
+        logger.error(f'Failed {city_name}: \n{err}')
+        response['status'] = str(err)
+        response['city_name'] = city_name
+    return response
+
+
+def calc_fetched_data(city_name: str, fetched_data: dict) -> dict:
+    """
+    param city_name: name of city to calc data
+    param fetched_data: fetched data of the city
+    """
+    logger.debug(f'Calculation data for {city_name}')
+    calc_result = {'status': fetched_data.get('status', 'No info'), 'city_name': city_name}
+    if calc_result['status'] != 'OK':
+        logger.error(f'Failed {city_name}: {calc_result["status"]}')
+        return calc_result
+    try:
+        calc_result['data'] = analyzer.analyze_json(fetched_data)
+        logger.debug(f'{city_name} data has been calculated')
+    except Exception as err:
+        logger.error(f'Failed {city_name}: \n{err}')
+        calc_result['status'] = str(err)
+    return calc_result
+
+
+def calc_weighted_avg(calc_data: dict) -> dict:
+    """
+    param calc_data: calculated data of the city
+    """
+    days = [day for day in calc_data['days'] if day['hours_count'] > 0]
+    calc_data['days'] = days
+    agg_temp_avg = 0
+    agg_relevant_cond_hours = 0
+    total_hours_count = 0
+
+    for day in days:
+        hours_count = day['hours_count']
+        agg_temp_avg += hours_count * day['temp_avg']
+        agg_relevant_cond_hours += hours_count * day['relevant_cond_hours']
+        total_hours_count += hours_count
+
+    if total_hours_count:
+        calc_data['agg_temp_avg'] = agg_temp_avg / total_hours_count
+        calc_data['agg_relevant_cond_hours'] = agg_relevant_cond_hours / total_hours_count
+    else:
+        calc_data['agg_temp_avg'] = calc_data['agg_relevant_cond_hours'] = math.nan
+    return calc_data
+
 
 class DataFetchingTask:
     """
     Class to fetch weather data via fake YandexWeatherAPI
     """
 
-    def __init__(self, city_names: list, data_dir: str = './data') -> None:
+    def __init__(self, city_names: list, data_dir: str = './data', persist: bool = True) -> None:
         """
         param city_names: list of city names
         param data_path: path with data files
+        param persist: save fetched data into data_path
         """
         super().__init__()
         self._api = YandexWeatherAPI()
         self._city_names = city_names
-        self._queue = Queue()
         self._data_dir = data_dir
-        try:
-            if not os.path.exists(self._data_dir):
-                logging.info(f'Cant find directory {self._data_dir}')
-                os.makedirs(self._data_dir)
-                logging.info(f'Created directory {self._data_dir}')
-        except OSError as err:
-            logging.error(f'Cant create directory {self._data_dir}: \n{err}')
+        self._persist = persist
+        if self._persist:
+            create_data_dir(self._data_dir)
 
     def _get_city_data(self, city_name: str) -> dict:
         """
         param city_name: name of city to get data
         """
         logger.debug(f'Fetching data for {city_name}')
-        response = {}
-        try:
-            url_with_data = get_url_by_city_name(city_name)
-            response = YandexWeatherAPI.get_forecasting(url_with_data)
-            response['city_name'] = city_name
-            if 'info' in response:
-                response['status'] = 'OK'
-                file_path = f'{self._data_dir}/{city_name}_fetched.json'
-                with open(file_path, 'w') as json_file:
-                    json.dump(response, json_file)
-                logger.debug(f'{city_name} data has been fetched and saved into {file_path}')
-            else:
-                response['status'] = 'No info'
-                logger.error(f'Failed {city_name}: \n{response["status"]}')
-
-        except YandexWeatherAPIError as err:
-            logger.error(f'Failed {city_name}: \n{err}')
-            response['status'] = str(err)
-            response['city_name'] = city_name
+        response = fetch_city_data(city_name)
+        if self._persist and response['status'] == 'OK':
+            file_path = f'{self._data_dir}/{city_name}_fetched.json'
+            save_json(file_path, response)
+            logger.debug(f'{city_name} data has been fetched and saved into {file_path}')
         return response
 
-    def run(self) -> Queue:
+    def run(self) -> list:
         logger.info('Data fetching started.')
-        futures_cities = []
-        with ThreadPoolExecutor() as pool:
-            futures_cities.extend(pool.submit(self._get_city_data, city_name) for city_name in self._city_names)
-            for future in as_completed(futures_cities, timeout=3):
-                self._queue.put(future.result())
+        results = []
+        max_workers = _get_fetch_workers(len(self._city_names))
+        # every request gives up after REQUEST_TIMEOUT, workers handle cities in rounds
+        timeout = REQUEST_TIMEOUT * math.ceil(len(self._city_names) / max_workers) + 1
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures_cities = [pool.submit(self._get_city_data, city_name) for city_name in self._city_names]
+            for future in as_completed(futures_cities, timeout=timeout):
+                results.append(future.result())
         logger.info('Data fetching is complete.')
-        return self._queue
+        return results
 
 
 class DataCalculationTask:
@@ -79,14 +256,17 @@ class DataCalculationTask:
     Class to use analyzer.py to calc statistic indicators
     """
 
-    def __init__(self, city_names: list, data_dir: str = './data') -> None:
+    def __init__(self, city_names: list, data_dir: str = './data', fetched: Optional[list] = None) -> None:
         """
         param city_names: list of city names
         param data_path: path with data files
+        param fetched: fetched data as returned by DataFetchingTask, used instead of data files
         """
         super().__init__()
         self._city_names = city_names
         self._data_dir = data_dir
+        self._fetched = None if fetched is None else {item['city_name']: item for item in fetched}
+        self.calculated: dict = {}
 
     def _calc_city_data(self, city_name: str) -> dict[str, str]:
         """
@@ -95,72 +275,63 @@ class DataCalculationTask:
         logger.debug(f'Calculation data for {city_name}')
         input_filename = f'{self._data_dir}/{city_name}_fetched.json'
         output_filename = f'{self._data_dir}/{city_name}_calc.json'
-        command_to_execute = [
-            'python3',
-            './external/analyzer.py',
-            '-i',
-            input_filename,
-            '-o',
-            output_filename,
-        ]
         calc_result = {'status': 'OK', 'city_name': city_name}
         try:
-            run = subprocess.run(command_to_execute, capture_output=True, text=True)
-            if run.stderr:
-                if 'No such file or directory' in run.stderr:
-                    calc_result['status'] = 'No such file or directory'
-                else:
-                    calc_result['status'] = run.stderr
-                logger.error(f'Failed {city_name}: {calc_result["status"]}')
-            else:
-                logger.debug(f'{city_name} data has been calculated and saved into {output_filename}')
-
-        except subprocess.CalledProcessError as err:
+            calc_data = analyzer.analyze_json(load_json(input_filename))
+            save_json(output_filename, calc_data)
+            logger.debug(f'{city_name} data has been calculated and saved into {output_filename}')
+        except FileNotFoundError:
+            calc_result['status'] = 'No such file or directory'
+            logger.error(f'Failed {city_name}: {calc_result["status"]}')
+        except Exception as err:
             logger.error(f'Failed {city_name}: \n{err}')
             calc_result['status'] = str(err)
         return calc_result
 
+    def _calc_cities_data(self) -> list:
+        pool = _get_process_pool()
+        chunksize = _get_chunksize(len(self._city_names))
+        if self._fetched is None:
+            return list(pool.map(_call_with_logs, repeat(self._calc_city_data), self._city_names,
+                                 chunksize=chunksize))
+        return list(pool.map(_call_with_logs, repeat(calc_fetched_data), self._city_names,
+                             [self._fetched.get(city, {}) for city in self._city_names],
+                             chunksize=chunksize))
+
     def run(self) -> dict:
         logger.info('Data calculation started.')
-        with Pool() as pool:
-            results = {calc_result['city_name']: calc_result['status'] for calc_result in
-                       pool.map(self._calc_city_data, self._city_names)}
+        try:
+            calc_results = self._calc_cities_data()
+        except BrokenProcessPool:
+            logger.warning('Process pool is broken, recreating it')
+            _reset_process_pool()
+            calc_results = self._calc_cities_data()
+        results = {}
+        for calc_result, records in calc_results:
+            _handle_worker_records(records)
+            results[calc_result['city_name']] = calc_result['status']
+            if 'data' in calc_result:
+                self.calculated[calc_result['city_name']] = calc_result['data']
         logger.info('Data calculation is complete.')
         return results
 
 
 class DataAggregationTask:
     """
-    Class to read calculated files
+    Class to read calculated files (or take calculated data in memory)
     and aggregate weighted average agg_temp_avg and agg_relevant_cond_hours values
     """
 
-    def __init__(self, city_names: list, data_dir: str = './data') -> None:
+    def __init__(self, city_names: list, data_dir: str = './data', calculated: Optional[dict] = None) -> None:
         """
         param city_names: list of city names
         param data_path: path with data files
+        param calculated: calculated data by city names, used instead of data files
         """
         super().__init__()
         self._city_names = city_names
         self._data_dir = data_dir
-
-    @staticmethod
-    def _calc_weighted_avg(agg_city_data: dict) -> dict:
-        d = agg_city_data['data']
-        d['agg_temp_avg'] = 0
-        d['agg_relevant_cond_hours'] = 0
-        total_hours_count = 0
-
-        for day in d['days']:
-            hours_count = day['hours_count']
-            if hours_count > 0:
-                d['agg_temp_avg'] += hours_count * day['temp_avg']
-                d['agg_relevant_cond_hours'] += hours_count * day['relevant_cond_hours']
-                total_hours_count += hours_count
-
-        d['agg_temp_avg'] /= total_hours_count
-        d['agg_relevant_cond_hours'] /= total_hours_count
-        return d
+        self._calculated = calculated
 
     def _get_agg_city_data(self, city_name: str) -> dict:
         """
@@ -169,28 +340,80 @@ class DataAggregationTask:
         logger.debug(f'Aggregating data for {city_name}')
         calc_filename = f'{self._data_dir}/{city_name}_calc.json'
         agg_city_data = {'data': {}}
-        try:
-            with open(calc_filename) as json_file:
-                data = json.load(json_file)
-                agg_city_data['data'] = data
+        if self._calculated is not None:
+            calc_data = self._calculated.get(city_name)
+            if calc_data:
+                # copy, calc_weighted_avg updates the data in place
+                agg_city_data['data'] = dict(calc_data, days=list(calc_data.get('days', [])))
+            agg_city_data['status'] = 'OK' if agg_city_data['data'] else 'No data'
+        else:
+            try:
+                agg_city_data['data'] = load_json(calc_filename)
                 agg_city_data['status'] = 'OK'
-        except (FileNotFoundError, json.JSONDecodeError) as err:
-            logger.error(f'Failed {city_name}: \n{err}')
-            agg_city_data['status'] = str(err)
+            except (FileNotFoundError, orjson.JSONDecodeError) as err:
+                logger.error(f'Failed {city_name}: \n{err}')
+                agg_city_data['status'] = str(err)
         agg_city_data['city_name'] = city_name
         if agg_city_data.get('data'):
-            agg_city_data['data'] = self._calc_weighted_avg(agg_city_data)
+            agg_city_data['data'] = calc_weighted_avg(agg_city_data['data'])
         return agg_city_data
 
     def run(self) -> dict:
         logger.info('Data aggregation started.')
-        with Pool() as pool:
-            results = {_['city_name']: _ for _ in
-                       pool.map(self._get_agg_city_data, self._city_names)}
+        results = {_['city_name']: _ for _ in
+                   _get_thread_pool().map(self._get_agg_city_data, self._city_names)}
         logger.info('Data aggregation is complete.')
         return results
 
 
+class DataPipelineTask:
+    """
+    Class to fetch, calculate and aggregate cities data in memory,
+    without intermediate files
+    """
+
+    def __init__(self, city_names: list, data_dir: str = './data', persist: bool = False) -> None:
+        """
+        param city_names: list of city names
+        param data_path: path with data files
+        param persist: save fetched and calculated data into data_path
+        """
+        super().__init__()
+        self._city_names = city_names
+        self._data_dir = data_dir
+        self._persist = persist
+        if self._persist:
+            create_data_dir(self._data_dir)
+
+    def _process_city(self, city_name: str) -> dict:
+        """
+        param city_name: name of city to process data
+        """
+        logger.debug(f'Processing data for {city_name}')
+        fetched = fetch_city_data(city_name)
+        calc_result = calc_fetched_data(city_name, fetched)
+        agg_city_data = {'data': calc_result.get('data', {}), 'status': calc_result['status'],
+                         'city_name': city_name, 'fetched': fetched}
+        if agg_city_data['status'] != 'OK':
+            return agg_city_data
+        if self._persist:
+            save_json(f'{self._data_dir}/{city_name}_fetched.json', fetched)
+            save_json(f'{self._data_dir}/{city_name}_calc.json', agg_city_data['data'])
+            logger.debug(f'{city_name} data has been saved into {self._data_dir}')
+        if agg_city_data['data']:
+            agg_city_data['data'] = calc_weighted_avg(agg_city_data['data'])
+        logger.debug(f'{city_name} data has been processed')
+        return agg_city_data
+
+    def run(self) -> dict:
+        logger.info('Data processing started.')
+        with ThreadPoolExecutor(max_workers=_get_fetch_workers(len(self._city_names))) as pool:
+            results = {_['city_name']: _ for _ in
+                       pool.map(self._process_city, self._city_names)}
+        logger.info('Data processing is complete.')
+        return results
+
+
 class DataAnalyzingTask:
     """
     Class to rank cities and provide output report
@@ -204,86 +427,81 @@ class DataAnalyzingTask:
         super().__init__()
         self.agg_cities_data = agg_cities_data
         self.report_filename = report_filename
+        self._report_future: Optional[Future] = None
 
     @staticmethod
-    def _rank_cities(agg_cities_data: dict) -> dict:
+    def _rank_cities(agg_cities_data: dict) -> list:
         logger.info('Ranking cities')
-        for city_name in agg_cities_data.copy():
-            if agg_cities_data[city_name].get('status', 'error') != 'OK':
-                del agg_cities_data[city_name]
+        valid_cities_data = {}
+        for city_name, data in agg_cities_data.items():
+            if data.get('status', 'error') != 'OK':
                 logger.debug(f'{city_name} was skipped, have no info')
-
-        for data in agg_cities_data.values():
-            data['data']['days'] = [day for day in data['data'].get('days', []) if day['hours_count'] > 0]
-
-        ranking_cities = [{'city_name': city_name,
-                           'agg_temp_avg': data['data']['agg_temp_avg'],
-                           'agg_relevant_cond_hours': data['data']['agg_relevant_cond_hours']
-                           } for city_name, data in agg_cities_data.items()]
-
-        ranking_cities.sort(key=lambda x: (x['agg_temp_avg'], x['agg_relevant_cond_hours']), reverse=True)
-
-        for i, city_name in enumerate(ranking_cities):
-            city_name['rank'] = i + 1
-
-        for city in ranking_cities:
-            agg_cities_data[city['city_name']]['rank'] = city['rank']
-        return agg_cities_data
-
-    def _find_best_city(self, agg_cities_data: dict) -> list:
-        sorted_cities_data = sorted(agg_cities_data.items(), key=lambda x: x[1].get('rank', len(agg_cities_data)))
-        sorted_cities = [city for city, data in sorted_cities_data]
-        if not sorted_cities:
+                continue
+            if math.isnan(data['data']['agg_temp_avg']):
+                logger.debug(f'{city_name} was skipped, have no hours to rank')
+                continue
+            valid_cities_data[city_name] = data
+
+        ranking_cities = list(valid_cities_data.items())
+        ranking_cities.sort(key=lambda x: (x[1]['data']['agg_temp_avg'], x[1]['data']['agg_relevant_cond_hours']),
+                            reverse=True)
+        for rank, (_, data) in enumerate(ranking_cities, 1):
+            data['rank'] = rank
+        return ranking_cities
+
+    def _find_best_city(self, ranked_cities: list) -> list:
+        if not ranked_cities:
             logging.info('Got empty list, nothing to analyze')
             return []
-        best_cities = [sorted_cities[0]]
-        best_city = agg_cities_data[sorted_cities[0]]['data']
+        best_cities = [ranked_cities[0][0]]
+        best_city = ranked_cities[0][1]['data']
         logger.info('The best city to live is:')
         logger.info(CITIES_TRANSLATION.get(best_cities[0], best_cities[0]))
-        if len(sorted_cities) > 1:
-            for i in range(len(sorted_cities) - 1):
-                next_city = agg_cities_data[sorted_cities[i + 1]]['data']
-                if next_city['agg_relevant_cond_hours'] == best_city['agg_relevant_cond_hours'] \
-                        and next_city['agg_temp_avg'] == best_city['agg_temp_avg']:
-                    logger.info(CITIES_TRANSLATION.get(sorted_cities[i + 1], sorted_cities[i + 1]))
-                    best_cities.append(sorted_cities[i + 1])
-                else:
-                    break
+        for city, city_data in ranked_cities[1:]:
+            next_city = city_data['data']
+            if next_city['agg_relevant_cond_hours'] == best_city['agg_relevant_cond_hours'] \
+                    and next_city['agg_temp_avg'] == best_city['agg_temp_avg']:
+                logger.info(CITIES_TRANSLATION.get(city, city))
+                best_cities.append(city)
+            else:
+                break
         logger.info(f'Average temperature: {best_city["agg_temp_avg"]}')
         logger.info(f'Average condition hours: {best_city["agg_temp_avg"]}')
+        self._report_future = _get_thread_pool().submit(self._save_output_report, ranked_cities)
+        return best_cities
+
+    def _save_output_report(self, ranked_cities: list) -> None:
         try:
-            self._generate_output_report(agg_cities_data, sorted_cities)
+            self._generate_output_report(ranked_cities)
         except xlsxwriter.exceptions.XlsxWriterException as err:
             logger.error(f'Cant generate output report: \n{err}')
-        return best_cities
+        except Exception:
+            # keep the error in the future for wait_for_report, but do not lose it if nobody waits
+            logger.exception('Cant generate output report')
+            raise
 
-    def _generate_output_report(self, agg_cities_data: dict, sorted_cities: list) -> None:
+    def _generate_output_report(self, ranked_cities: list) -> None:
         logger.info('Generating output report')
-        workbook = xlsxwriter.Workbook(self.report_filename)
-        sheet = workbook.add_worksheet()
-        sheet.write(0, 0, 'Город / день')
-        dates = [day['date'] for day in next(iter(agg_cities_data.values()))['data']['days']]
-        for i, date in enumerate(dates):
-            sheet.write(0, i + 2, date[-5:])
-        sheet.write(0, len(dates) + 2, 'Среднее')
-        sheet.write(0, len(dates) + 3, 'Рейтинг')
-        curr_row = 0
-        format_float = workbook.add_format({'num_format': '0.0'})
-        for city in sorted_cities:
-            city_data = agg_cities_data[city]
-            curr_row += 1
-            sheet.write(curr_row, 0, CITIES_TRANSLATION.get(city, city))
-            sheet.write(curr_row, 1, 'Температура, среднее')
-            for i, day in enumerate(city_data['data']['days']):
-                sheet.write(curr_row, i + 2, day['temp_avg'], format_float)
-            sheet.write(curr_row, len(dates) + 2, city_data['data']['agg_temp_avg'], format_float)
-            sheet.write(curr_row, len(dates) + 3, city_data['rank'])
-            curr_row += 1
-            sheet.write(curr_row, 1, 'Без осадков, часов')
-            for i, day in enumerate(city_data['data']['days']):
-                sheet.write(curr_row, i + 2, day['relevant_cond_hours'], format_float)
-            sheet.write(curr_row, len(dates) + 2, city_data['data']['agg_relevant_cond_hours'], format_float)
-        workbook.close()
+        with xlsxwriter.Workbook(self.report_filename, {'constant_memory': True}) as workbook:
+            sheet = workbook.add_worksheet()
+            sheet.write(0, 0, 'Город / день')
+            dates = [day['date'] for day in ranked_cities[0][1]['data']['days']]
+            avg_col = len(dates) + 2
+            rank_col = len(dates) + 3
+            sheet.write_row(0, 2, [date[-5:] for date in dates] + ['Среднее', 'Рейтинг'])
+            curr_row = 0
+            format_float = workbook.add_format({'num_format': '0.0'})
+            for city, city_data in ranked_cities:
+                data = city_data['data']
+                curr_row += 1
+                sheet.write_row(curr_row, 0, [CITIES_TRANSLATION.get(city, city), 'Температура, среднее'])
+                sheet.write_row(curr_row, 2, [day['temp_avg'] for day in data['days']], format_float)
+                sheet.write(curr_row, avg_col, data['agg_temp_avg'], format_float)
+                sheet.write(curr_row, rank_col, city_data['rank'])
+                curr_row += 1
+                sheet.write(curr_row, 1, 'Без осадков, часов')
+                sheet.write_row(curr_row, 2, [day['relevant_cond_hours'] for day in data['days']], format_float)
+                sheet.write(curr_row, avg_col, data['agg_relevant_cond_hours'], format_float)
         logger.info(f'Report was generated and saved to {self.report_filename}')
 
     def run(self) -> list:
@@ -293,11 +511,18 @@ class DataAnalyzingTask:
         logger.info('Data analyzing is complete.')
         return results
 
+    def wait_for_report(self, timeout: Optional[float] = None) -> None:
+        """
+        :param timeout: max seconds to wait for the report to be saved
+        """
+        if self._report_future is not None:
+            self._report_future.result(timeout=timeout)
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
     cities = CITIES
-    DataFetchingTask(cities).run()
-    DataCalculationTask(cities).run()
-    agg_data = DataAggregationTask(cities).run()
-    DataAnalyzingTask(agg_data).run()
+    agg_data = DataPipelineTask(cities).run()
+    analyzing_task = DataAnalyzingTask(agg_data)
+    analyzing_task.run()
+    analyzing_task.wait_for_report()
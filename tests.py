@@ -1,15 +1,28 @@
+import os
+import math
+import zipfile
+import time
+import tempfile
+import threading
 import unittest
 import logging
+from unittest import mock
+from concurrent.futures.process import BrokenProcessPool
 from multiprocessing import Process
-from queue import Queue
 
 from tasks import (DataAggregationTask,
                    DataAnalyzingTask,
                    DataCalculationTask,
-                   DataFetchingTask)
+                   DataFetchingTask,
+                   DataPipelineTask,
+                   _get_process_pool)
+from external.client import POOL_SIZE
 
 logging.basicConfig(level=logging.DEBUG)
 
+NO_HOURS_CALCULATED = {'MOSCOW': {'days': [{'date': '2022-05-18', 'hours_count': 0,
+                                            'temp_avg': None, 'relevant_cond_hours': 0}]}}
+
 
 class DataFetchingTest(unittest.TestCase):
     @classmethod
@@ -21,23 +34,17 @@ class DataFetchingTest(unittest.TestCase):
         logging.debug("Data fetching tests finished...")
 
     def test_valid_data(self):
-        queue = DataFetchingTask(['MOSCOW', 'LONDON', 'BERLIN']).run()
-        fetched_data = {}
-        for _ in range(queue.qsize()):
-            item = queue.get()
-            fetched_data[item['city_name']] = item
+        fetched_data = {item['city_name']: item for item in DataFetchingTask(['MOSCOW', 'LONDON', 'BERLIN']).run()}
         self.assertEqual(len(fetched_data), 3)
         self.assertEqual(fetched_data['BERLIN']['status'], 'OK')
         self.assertEqual(fetched_data['LONDON']['info']['lon'], 0.07)
         self.assertIn('forecasts', fetched_data['MOSCOW'])
 
     def test_extra_data(self):
-        queue = DataFetchingTask(['TORONTO']).run()
-        self.assertIn('Extra data', queue.get()['status'])
+        self.assertIn('Extra data', DataFetchingTask(['TORONTO']).run()[0]['status'])
 
     def test_not_found_data(self):
-        queue = DataFetchingTask(['GIZA']).run()
-        self.assertIn('HTTP Error 404', queue.get()['status'])
+        self.assertIn('HTTP Error 404', DataFetchingTask(['GIZA']).run()[0]['status'])
 
 
 class DataCalculationTest(unittest.TestCase):
@@ -56,6 +63,26 @@ class DataCalculationTest(unittest.TestCase):
     def test_not_found_file(self):
         self.assertIn('No such file or directory', DataCalculationTask(['GIZA']).run()['GIZA'])
 
+    def test_broken_process_pool(self):
+        with self.assertRaises(BrokenProcessPool):
+            _get_process_pool().submit(os._exit, 1).result()
+        self.assertIn('No such file or directory', DataCalculationTask(['GIZA']).run()['GIZA'])
+
+    def test_worker_logging(self):
+        with self.assertLogs('tasks', level='DEBUG') as logs:
+            DataCalculationTask(['GIZA']).run()
+        self.assertIn('DEBUG:tasks:Calculation data for GIZA', logs.output)
+        self.assertIn('ERROR:tasks:Failed GIZA: No such file or directory', logs.output)
+
+    def test_fetched_data(self):
+        fetched = DataFetchingTask(['MOSCOW', 'GIZA'], persist=False).run()
+        calc_task = DataCalculationTask(['MOSCOW', 'GIZA'], fetched=fetched)
+        results = calc_task.run()
+        self.assertEqual(results['MOSCOW'], 'OK')
+        self.assertIn('HTTP Error 404', results['GIZA'])
+        self.assertIn('days', calc_task.calculated['MOSCOW'])
+        self.assertNotIn('GIZA', calc_task.calculated)
+
 
 class DataAggregationTest(unittest.TestCase):
     @classmethod
@@ -74,6 +101,74 @@ class DataAggregationTest(unittest.TestCase):
     def test_not_found_file(self):
         self.assertIn('No such file or directory', DataAggregationTask(['GIZA']).run()['GIZA']['status'])
 
+    def test_calculated_data(self):
+        calculated = {'MOSCOW': {'days': [{'date': '2022-05-18', 'hours_count': 10,
+                                           'temp_avg': 10, 'relevant_cond_hours': 5},
+                                          {'date': '2022-05-19', 'hours_count': 0,
+                                           'temp_avg': None, 'relevant_cond_hours': 0},
+                                          {'date': '2022-05-20', 'hours_count': 5,
+                                           'temp_avg': 16, 'relevant_cond_hours': 2}]}}
+        agg_data = DataAggregationTask(['MOSCOW', 'GIZA'], calculated=calculated).run()
+        self.assertEqual(agg_data['MOSCOW']['data']['agg_temp_avg'], 12)
+        self.assertEqual(agg_data['MOSCOW']['data']['agg_relevant_cond_hours'], 4)
+        self.assertEqual(agg_data['GIZA']['status'], 'No data')
+        self.assertEqual(len(calculated['MOSCOW']['days']), 3)
+        self.assertNotIn('agg_temp_avg', calculated['MOSCOW'])
+
+    def test_in_memory_data(self):
+        city_names = ['MOSCOW', 'LONDON', 'BERLIN', 'GIZA']
+        fetched = DataFetchingTask(city_names, persist=False).run()
+        calc_task = DataCalculationTask(city_names, fetched=fetched)
+        calc_task.run()
+        agg_data = DataAggregationTask(city_names, calculated=calc_task.calculated).run()
+        self.assertEqual(agg_data['BERLIN']['status'], 'OK')
+        self.assertIn('agg_temp_avg', agg_data['MOSCOW']['data'])
+        self.assertEqual(agg_data['GIZA']['status'], 'No data')
+        self.assertNotIn('agg_temp_avg', calc_task.calculated['MOSCOW'])
+
+    def test_no_hours_data(self):
+        agg_data = DataAggregationTask(['MOSCOW'], calculated=NO_HOURS_CALCULATED).run()
+        self.assertTrue(math.isnan(agg_data['MOSCOW']['data']['agg_temp_avg']))
+        self.assertTrue(math.isnan(agg_data['MOSCOW']['data']['agg_relevant_cond_hours']))
+
+
+class DataPipelineTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        logging.debug("Data pipeline tests started...")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        logging.debug("Data pipeline tests finished...")
+
+    def test_valid_data(self):
+        processed_data = DataPipelineTask(['MOSCOW', 'LONDON', 'BERLIN']).run()
+        self.assertEqual(len(processed_data), 3)
+        self.assertEqual(processed_data['BERLIN']['status'], 'OK')
+        self.assertEqual(processed_data['LONDON']['fetched']['info']['lon'], 0.07)
+        self.assertIn('agg_temp_avg', processed_data['MOSCOW']['data'])
+
+    def test_not_found_data(self):
+        self.assertIn('HTTP Error 404', DataPipelineTask(['GIZA']).run()['GIZA']['status'])
+
+    def test_fetch_workers_fit_connection_pool(self):
+        lock = threading.Lock()
+        active = {'now': 0, 'max': 0}
+
+        def fetch_city_data(city_name):
+            with lock:
+                active['now'] += 1
+                active['max'] = max(active['max'], active['now'])
+            time.sleep(0.01)
+            with lock:
+                active['now'] -= 1
+            return {'city_name': city_name, 'status': 'No info'}
+
+        city_names = [f'CITY_{i}' for i in range(POOL_SIZE * 2)]
+        with mock.patch('tasks.fetch_city_data', fetch_city_data):
+            self.assertEqual(len(DataPipelineTask(city_names).run()), len(city_names))
+        self.assertLessEqual(active['max'], POOL_SIZE)
+
 
 class DataDataAnalyzingTest(unittest.TestCase):
     @classmethod
@@ -86,7 +181,36 @@ class DataDataAnalyzingTest(unittest.TestCase):
 
     def test_find_best_city(self):
         agg_data = DataAggregationTask(['MOSCOW', 'LONDON', 'BERLIN', 'GIZA']).run()
-        self.assertEqual(DataAnalyzingTask(agg_data).run(), ['BERLIN'])
+        analyzing_task = DataAnalyzingTask(agg_data)
+        self.assertEqual(analyzing_task.run(), ['BERLIN'])
+        analyzing_task.wait_for_report(timeout=10)
+
+    def test_output_report(self):
+        agg_data = DataAggregationTask(['MOSCOW', 'LONDON', 'BERLIN']).run()
+        with tempfile.TemporaryDirectory() as report_dir:
+            report_filename = os.path.join(report_dir, 'report.xlsx')
+            analyzing_task = DataAnalyzingTask(agg_data, report_filename)
+            analyzing_task.run()
+            self.assertIsNone(analyzing_task.wait_for_report(timeout=10))
+            with zipfile.ZipFile(report_filename) as report:
+                sheet = report.read('xl/worksheets/sheet1.xml').decode('utf-8')
+            self.assertIn('Рейтинг', sheet)
+            for city in ('Москва', 'Лондон'):
+                self.assertIn(city, sheet)
+                self.assertLess(sheet.index('Берлин'), sheet.index(city))
+
+    def test_output_report_error(self):
+        agg_data = {'MOSCOW': {'status': 'OK', 'data': {'agg_temp_avg': 10, 'agg_relevant_cond_hours': 5}}}
+        with tempfile.TemporaryDirectory() as report_dir:
+            analyzing_task = DataAnalyzingTask(agg_data, os.path.join(report_dir, 'report.xlsx'))
+            with self.assertLogs('tasks', level='ERROR'):
+                self.assertEqual(analyzing_task.run(), ['MOSCOW'])
+                with self.assertRaises(KeyError):
+                    analyzing_task.wait_for_report(timeout=10)
+
+    def test_skip_no_hours_city(self):
+        agg_data = DataAggregationTask(['MOSCOW'], calculated=NO_HOURS_CALCULATED).run()
+        self.assertEqual(DataAnalyzingTask(agg_data).run(), [])
 
 
 if __name__ == "__main__":